@@ -1,32 +1,101 @@
+# Run pandas operations on the GPU through cuDF when it is installed,
+# falling back to plain pandas otherwise
+try:
+    import cudf.pandas
+    cudf.pandas.install()
+    USE_CUDF = True
+except (ImportError, RuntimeError):
+    USE_CUDF = False
+
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 from datetime import datetime
 import matplotlib.pyplot as plt
 import seaborn as sns
 from tqdm import tqdm
+from parquet_stats import parquet_column_range
+
+PROCESSED_DATA_PATH = 'processed_data/processed_transcripts.parquet'
+
+# Columns used by the in-memory analyses; COMPONENTTEXT is streamed separately
+ANALYSIS_COLUMNS = ['COMPANYNAME', 'DATEOFCALLUTC', 'TRANSCRIPTCOMPONENTTYPE',
+                    'SPEAKERTYPE', 'TRANSCRIPTID']
 
-def load_transcript_data(file_path='processed_data/processed_transcripts.parquet'):
-    """Load the processed transcript data"""
+# Low-cardinality keys that are grouped and counted repeatedly
+CATEGORICAL_COLUMNS = ['COMPANYNAME', 'TRANSCRIPTCOMPONENTTYPE', 'SPEAKERTYPE']
+
+def load_transcript_data(file_path=PROCESSED_DATA_PATH, columns=None):
+    """Load the processed transcript data, optionally reading only some columns"""
     print(f"Loading data from {file_path}...")
-    return pd.read_parquet(file_path)
+    # Arrow-backed dtypes keep string columns out of Python objects on the CPU;
+    # cuDF uses its own GPU columns instead
+    read_options = {} if USE_CUDF else {'dtype_backend': 'pyarrow'}
+    df = pd.read_parquet(file_path, columns=columns, engine='pyarrow', **read_options)
+    
+    # Categorical codes are far cheaper to hash than the repeated strings
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def iter_transcript_batches(file_path, columns, batch_size=100_000):
+    """Stream record batches of selected columns from the processed parquet data"""
+    return ds.dataset(file_path, format='parquet').to_batches(columns=columns, batch_size=batch_size)
+
+def text_length_stats(file_path, batch_size=100_000):
+    """Aggregate text length statistics by component type without loading all text at once"""
+    partials = []
+    batches = iter_transcript_batches(file_path, ['TRANSCRIPTCOMPONENTTYPE', 'COMPONENTTEXT'], batch_size)
+    for batch in batches:
+        # utf8_length walks the Arrow offsets buffer instead of each Python string
+        lengths = pa.table({
+            'TRANSCRIPTCOMPONENTTYPE': batch.column('TRANSCRIPTCOMPONENTTYPE'),
+            'text_length': pc.utf8_length(batch.column('COMPONENTTEXT')),
+        })
+        partials.append(lengths.group_by('TRANSCRIPTCOMPONENTTYPE').aggregate([
+            ('text_length', 'sum'), ('text_length', 'count'),
+            ('text_length', 'min'), ('text_length', 'max'),
+        ]))
+    
+    if not partials:
+        return pd.DataFrame(columns=['mean', 'min', 'max'])
+    
+    # Combine the per-batch partial aggregates
+    stats = pa.concat_tables(partials).group_by('TRANSCRIPTCOMPONENTTYPE').aggregate([
+        ('text_length_sum', 'sum'), ('text_length_count', 'sum'),
+        ('text_length_min', 'min'), ('text_length_max', 'max'),
+    ]).to_pandas(types_mapper=pd.ArrowDtype).dropna(subset=['TRANSCRIPTCOMPONENTTYPE'])
+    stats = stats.set_index('TRANSCRIPTCOMPONENTTYPE').sort_index()
+    return pd.DataFrame({
+        'mean': stats['text_length_sum_sum'] / stats['text_length_count_sum'],
+        'min': stats['text_length_min_min'],
+        'max': stats['text_length_max_max'],
+    })
 
-def analyze_basic_stats(df):
+def analyze_basic_stats(df, file_path=None):
     """Analyze basic statistics of the dataset"""
     print("\n=== Basic Dataset Statistics ===")
     print("-" * 50)
     print(f"Total number of rows: {len(df):,}")
     print(f"Number of unique companies: {df['COMPANYNAME'].nunique():,}")
-    print(f"Date range: {df['DATEOFCALLUTC'].min()} to {df['DATEOFCALLUTC'].max()}")
+    if file_path is not None:
+        first_call, last_call = parquet_column_range(file_path, 'DATEOFCALLUTC')
+    else:
+        first_call, last_call = df['DATEOFCALLUTC'].min(), df['DATEOFCALLUTC'].max()
+    print(f"Date range: {first_call} to {last_call}")
     
     # Component types analysis
     print("\nTranscript Component Types:")
     comp_types = df['TRANSCRIPTCOMPONENTTYPE'].value_counts()
-    print(comp_types.to_string())
+    print(comp_types.head(20).to_string())
     
     # Speaker types analysis
     print("\nSpeaker Types:")
     speaker_types = df['SPEAKERTYPE'].value_counts()
-    print(speaker_types.to_string())
+    print(speaker_types.head(20).to_string())
 
 def analyze_temporal_patterns(df):
     """Analyze temporal patterns in the transcripts"""
@@ -36,12 +105,17 @@ def analyze_temporal_patterns(df):
     # Convert to datetime if not already
     df['DATEOFCALLUTC'] = pd.to_datetime(df['DATEOFCALLUTC'])
     
-    # Calls per month
-    monthly_calls = df.groupby(['COMPANYNAME', pd.Grouper(key='DATEOFCALLUTC', freq='M')]).size().reset_index()
-    calls_per_month = monthly_calls.groupby('DATEOFCALLUTC').size()
+    # Calls per month: one hash pass over distinct (company, month) pairs
+    monthly_calls = pd.DataFrame({
+        'COMPANYNAME': df['COMPANYNAME'],
+        'DATEOFCALLUTC': df['DATEOFCALLUTC'].dt.to_period('M'),
+    }).dropna().drop_duplicates()
+    calls_per_month = monthly_calls['DATEOFCALLUTC'].value_counts().sort_index()
     
+    # Print row by row rather than building one large string
     print("\nCalls per month:")
-    print(calls_per_month.to_string())
+    for month, n_calls in calls_per_month.items():
+        print(f"{month}  {n_calls}")
     
     # Most active months
     print("\nMost active months:")
@@ -53,17 +127,18 @@ def analyze_company_patterns(df):
     print("-" * 50)
     
     # Companies with most calls
-    company_calls = df.groupby('COMPANYNAME').size().sort_values(ascending=False)
+    company_calls = df.groupby('COMPANYNAME', observed=True).size().sort_values(ascending=False)
     print("\nTop 10 Companies by Number of Transcript Components:")
     print(company_calls.head(10).to_string())
     
-    # Average call length (by component count) per company
-    calls_per_company = df.groupby(['COMPANYNAME', 'TRANSCRIPTID']).size()
-    avg_length = calls_per_company.groupby('COMPANYNAME').mean().sort_values(ascending=False)
+    # Average call length (by component count) per company, in a single groupby
+    call_counts = df.groupby('COMPANYNAME', sort=False, observed=True).agg(
+        n_rows=('TRANSCRIPTID', 'count'), n_calls=('TRANSCRIPTID', 'nunique'))
+    avg_length = call_counts.eval('n_rows / n_calls').sort_values(ascending=False)
     print("\nTop 10 Companies by Average Call Length (component count):")
     print(avg_length.head(10).to_string())
 
-def analyze_content_patterns(df):
+def analyze_content_patterns(df, file_path=PROCESSED_DATA_PATH):
     """Analyze patterns in the transcript content"""
     print("\n=== Content Analysis ===")
     print("-" * 50)
@@ -71,9 +146,8 @@ def analyze_content_patterns(df):
     # Sample size for text analysis (to avoid memory issues)
     sample_size = min(10000, len(df))
     
-    # Average text length by component type
-    df['text_length'] = df['COMPONENTTEXT'].str.len()
-    avg_length = df.groupby('TRANSCRIPTCOMPONENTTYPE')['text_length'].agg(['mean', 'min', 'max'])
+    # Average text length by component type, streamed from the parquet file
+    avg_length = text_length_stats(file_path)
     print("\nText Length Statistics by Component Type:")
     print(avg_length.round(2).to_string())
     
@@ -83,11 +157,11 @@ def analyze_content_patterns(df):
     print(speaker_roles.head(10).to_string())
 
 def main():
-    # Load the data
-    df = load_transcript_data()
+    # Load only the columns the analyses need
+    df = load_transcript_data(columns=ANALYSIS_COLUMNS)
     
     # Run analyses
-    analyze_basic_stats(df)
+    analyze_basic_stats(df, PROCESSED_DATA_PATH)
     analyze_temporal_patterns(df)
     analyze_company_patterns(df)
     analyze_content_patterns(df)
@@ -0,0 +1,30 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+def parquet_column_range(path, column):
+    """Get the min and max of a column from parquet row-group statistics"""
+    fragments = list(ds.dataset(path, format='parquet').get_fragments())
+    mins = []
+    maxs = []
+    for fragment in fragments:
+        metadata = fragment.metadata
+        index = fragment.physical_schema.get_field_index(column)
+        if index < 0:
+            # This file has no such column
+            continue
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            stats = row_group.column(index).statistics
+            if stats is not None and stats.has_min_max:
+                mins.append(stats.min)
+                maxs.append(stats.max)
+            elif stats is None or stats.null_count != row_group.num_rows:
+                # Statistics are missing, so scan the column across every file's schema
+                schema = pa.unify_schemas([f.physical_schema for f in fragments])
+                values = ds.dataset(path, schema=schema, format='parquet').to_table(columns=[column])[column]
+                result = pc.min_max(values)
+                return result['min'].as_py(), result['max'].as_py()
+    if not mins:
+        return None, None
+    return min(mins), max(maxs)
@@ -1,12 +1,38 @@
 import pandas as pd
 import numpy as np
 import os
-import gc
+import gzip
+import shutil
+import multiprocessing
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from tqdm import tqdm
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from parquet_stats import parquet_column_range
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+ROW_TERMINATOR = b'`'
+FIELD_DELIMITER = b'~'
+DATE_COLUMNS = ['ANNOUNCEDDATEUTC', 'DATEOFCALLUTC']
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 
 def get_file_size(file_path):
-    """Get file size in MB"""
+    """Get file size in MB, summing the files of a directory"""
+    if os.path.isdir(file_path):
+        return sum(f.stat().st_size for f in Path(file_path).rglob('*') if f.is_file()) / (1024 * 1024)
     return os.path.getsize(file_path) / (1024 * 1024)
 
 def analyze_file_structure(file_path):
@@ -21,38 +47,339 @@ def analyze_file_structure(file_path):
     
     return sample
 
-def read_custom_format(file_path, chunk_size=100_000):
-    """Read CSV file in chunks with progress tracking using custom delimiters"""
+def iter_decompressed_blocks(file_path, block_size=1 << 22, show_progress=True):
+    """Yield decompressed blocks of a gzip file, tracking progress by compressed bytes"""
+    with open(file_path, 'rb') as raw, gzip.GzipFile(fileobj=raw) as handle:
+        with tqdm(total=os.path.getsize(file_path), unit='B', unit_scale=True,
+                  desc='Reading', disable=not show_progress) as pbar:
+            while True:
+                block = handle.read(block_size)
+                if not block:
+                    break
+                pbar.update(raw.tell() - pbar.n)
+                yield block
+
+def iter_row_blocks(file_path, block_size=1 << 22, show_progress=True):
+    """Yield blocks of complete rows, carrying partial rows across block boundaries"""
+    carry = b''
+    for block in iter_decompressed_blocks(file_path, block_size, show_progress):
+        block = carry + block
+        end = block.rfind(ROW_TERMINATOR) + 1
+        carry = block[end:]
+        if end:
+            yield block[:end]
+    if carry:
+        yield carry
+
+def _escape_block(buf):
+    """Escape embedded line breaks so each row terminator can become a newline"""
+    block = buf.to_pybytes().replace(b'\\', b'\\\\').replace(b'\x01', b'\\\x01')
+    block = block.replace(b'\n', b'\\\n').replace(b'\r', b'\\\r')
+    return pa.py_buffer(block.replace(ROW_TERMINATOR, b'\n'))
+
+def _split_rows(rows, headers):
+    """Split an array of raw rows into an Arrow table with Arrow compute kernels"""
+    n_fields = pc.add(pc.count_substring(rows, FIELD_DELIMITER.decode()), 1)
+    # Match pandas: skip rows with too many fields, pad short ones
+    keep = pc.less_equal(n_fields, len(headers))
+    rows = rows.filter(keep)
+    padding = pc.binary_repeat(FIELD_DELIMITER.decode(), pc.subtract(len(headers), n_fields.filter(keep)))
+    fields = pc.split_pattern(pc.binary_join_element_wise(rows, padding, ''), FIELD_DELIMITER.decode())
+    
+    columns = []
+    for i in range(len(headers)):
+        column = pc.list_element(fields, i)
+        columns.append(pc.if_else(pc.equal(column, ''), pa.scalar(None, pa.string()), column))
+    return pa.Table.from_arrays(columns, names=headers)
+
+def _iter_csv_tables(file_path, block_size=1 << 22, show_progress=True):
+    """Stream a custom-delimited file through the Arrow CSV reader, one table per batch"""
+    with pa.OSFile(str(file_path)) as raw, tqdm(total=os.path.getsize(file_path), unit='B', unit_scale=True,
+                                                 desc='Reading', disable=not show_progress) as pbar:
+        stream = pa.TransformInputStream(pa.CompressedInputStream(raw, 'gzip'), _escape_block)
+        # Each row is read whole as one column (\x01 is escaped) and split afterwards
+        reader = pv.open_csv(
+            stream,
+            read_options=pv.ReadOptions(column_names=['row'], block_size=block_size),
+            parse_options=pv.ParseOptions(delimiter='\x01', quote_char=False, escape_char='\\',
+                                          newlines_in_values=True),
+            convert_options=pv.ConvertOptions(column_types={'row': pa.string()},
+                                              strings_can_be_null=False, quoted_strings_can_be_null=False),
+        )
+        headers = None
+        for batch in reader:
+            rows = batch.column('row')
+            if headers is None and len(rows) > 0:
+                headers = rows[0].as_py().split(FIELD_DELIMITER.decode())
+                rows = rows.slice(1)
+            pbar.update(raw.tell() - pbar.n)
+            if headers is not None:
+                yield _split_rows(rows, headers)
+
+if njit is not None:
+    @njit(cache=True)
+    def _tokenize_block(buf, n_columns, field_delimiter, row_terminator):
+        """Record the start/end offset of every field, plus the field count of each row"""
+        n_rows = 0
+        for byte in buf:
+            if byte == row_terminator:
+                n_rows += 1
+        if len(buf) > 0 and buf[-1] != row_terminator:
+            n_rows += 1
+        
+        starts = np.full((n_rows, n_columns), -1, np.int64)
+        ends = np.full((n_rows, n_columns), -1, np.int64)
+        n_fields = np.zeros(n_rows, np.int64)
+        row = 0
+        col = 0
+        start = 0
+        for pos in range(len(buf)):
+            byte = buf[pos]
+            if byte == field_delimiter or byte == row_terminator:
+                if col < n_columns:
+                    starts[row, col] = start
+                    ends[row, col] = pos
+                col += 1
+                start = pos + 1
+                if byte == row_terminator:
+                    n_fields[row] = col
+                    row += 1
+                    col = 0
+        
+        # A final row without a terminator (end of file)
+        if row < n_rows:
+            if col < n_columns:
+                starts[row, col] = start
+                ends[row, col] = len(buf)
+            n_fields[row] = col + 1
+        return starts, ends, n_fields
+
+    @njit(cache=True)
+    def _gather_column(buf, starts, ends, keep):
+        """Copy one column's fields into contiguous Arrow string buffers"""
+        n = len(keep)
+        offsets = np.zeros(n + 1, np.int32)
+        valid = np.zeros(n, np.bool_)
+        total = 0
+        for k in range(n):
+            i = keep[k]
+            if starts[i] >= 0 and ends[i] > starts[i]:
+                total += ends[i] - starts[i]
+                valid[k] = True
+            offsets[k + 1] = total
+        
+        data = np.empty(total, np.uint8)
+        pos = 0
+        for k in range(n):
+            if valid[k]:
+                i = keep[k]
+                length = ends[i] - starts[i]
+                data[pos:pos + length] = buf[starts[i]:ends[i]]
+                pos += length
+        return offsets, data, valid
+
+def _parse_block_numba(block, headers):
+    """Parse a block of complete rows into an Arrow table with compiled tokenizing"""
+    buf = np.frombuffer(block, dtype=np.uint8)
+    starts, ends, n_fields = _tokenize_block(buf, len(headers), FIELD_DELIMITER[0], ROW_TERMINATOR[0])
+    
+    # Match pandas: skip blank rows and rows with too many fields, pad short ones
+    blank = (n_fields == 1) & (starts[:, 0] == ends[:, 0])
+    keep = np.flatnonzero((n_fields <= len(headers)) & ~blank)
+    
+    columns = []
+    for col in range(len(headers)):
+        offsets, data, valid = _gather_column(buf, starts[:, col], ends[:, col], keep)
+        array = pa.StringArray.from_buffers(
+            len(keep), pa.py_buffer(offsets), pa.py_buffer(data),
+            pa.py_buffer(np.packbits(valid, bitorder='little')))
+        # The buffers bypass decoding, so check the bytes are valid UTF-8
+        array.validate(full=True)
+        columns.append(array)
+    return pa.Table.from_arrays(columns, names=headers)
+
+def _split_header(block):
+    """Split the header row off the first block, returning the column names and the rest"""
+    header_row, _, rest = block.lstrip(ROW_TERMINATOR).partition(ROW_TERMINATOR)
+    return [field.decode() for field in header_row.split(FIELD_DELIMITER)], rest
+
+def read_headers(file_path):
+    """Read the column names from the header row of a custom-delimited file"""
+    for block in iter_row_blocks(file_path, show_progress=False):
+        if block.strip(ROW_TERMINATOR):
+            return _split_header(block)[0]
+    return []
+
+def _iter_numba_tables(file_path, block_size=1 << 22, show_progress=True):
+    """Parse a custom-delimited file with the compiled tokenizer, one table per block"""
+    headers = None
+    for block in iter_row_blocks(file_path, block_size, show_progress):
+        if headers is None:
+            # Blank rows before the header can fill a whole block
+            if not block.strip(ROW_TERMINATOR):
+                continue
+            headers, block = _split_header(block)
+        yield _parse_block_numba(block, headers)
+
+def iter_custom_format(file_path, chunk_size=100_000, show_progress=True, block_size=1 << 22, engine=None):
+    """Parse a custom-delimited file into Arrow table chunks of up to chunk_size rows"""
+    # Use the compiled tokenizer when numba is installed, else the streaming Arrow CSV reader
+    if engine is None:
+        engine = 'numba' if njit is not None else 'arrow'
+    iter_tables = _iter_numba_tables if engine == 'numba' else _iter_csv_tables
+    pending = []
+    pending_rows = 0
+    for table in iter_tables(file_path, block_size, show_progress):
+        if table.num_rows == 0:
+            continue
+        pending.append(table)
+        pending_rows += table.num_rows
+        while pending_rows >= chunk_size:
+            combined = pa.concat_tables(pending)
+            yield combined.slice(0, chunk_size)
+            pending = [combined.slice(chunk_size)]
+            pending_rows = pending[0].num_rows
+    if pending_rows:
+        yield pa.concat_tables(pending)
+
+def _parse_mixed_dates(column, name):
+    """Parse dates in any layout pandas understands, setting unparseable values to null"""
+    values = pd.to_datetime(column.to_pandas(), format='mixed', utc=True, errors='coerce')
+    failed = int(values.isna().sum()) - column.null_count
+    if failed:
+        print(f"Warning: {failed:,} unparseable {name} values set to null")
+    # Zone-aware values are kept as naive UTC to match the output schema
+    return pa.array(values.dt.tz_localize(None)).cast(pa.timestamp('us'), safe=False)
+
+def clean_dates(table):
+    """Convert date columns of an Arrow table to timestamps"""
+    for col in DATE_COLUMNS:
+        if col in table.column_names:
+            try:
+                # An explicit format avoids per-value format detection
+                parsed = pc.strptime(table[col], format=DATE_FORMAT, unit='us')
+            except pa.ArrowInvalid:
+                # Zone suffixes or other layouts
+                parsed = _parse_mixed_dates(table[col], col)
+            table = table.set_column(table.schema.get_field_index(col), col, parsed)
+    return table
+
+def processed_schema(files):
+    """Build one output schema covering the columns of every input file"""
+    columns = []
+    for file in files:
+        columns.extend(col for col in read_headers(file) if col not in columns)
+    return pa.schema([(col, pa.timestamp('us') if col in DATE_COLUMNS else pa.string())
+                      for col in columns])
+
+def conform_to_schema(table, schema):
+    """Reorder a table's columns to match schema, adding null columns for missing ones"""
+    return pa.Table.from_arrays(
+        [table[field.name] if field.name in table.column_names else pa.nulls(table.num_rows, field.type)
+         for field in schema],
+        schema=schema)
+
+def write_file_to_parquet(file_path, output_path, schema, chunk_size=100_000):
+    """Parse one file chunk by chunk, appending each chunk to its own parquet file"""
     total_rows = 0
-    chunks = []
-    
-    # Count total rows for progress bar
-    print(f"\nCounting rows in {file_path}...")
-    for chunk in pd.read_csv(file_path, sep='~', lineterminator='`', compression='gzip', 
-                           chunksize=chunk_size, on_bad_lines='skip', 
-                           quoting=3, dtype=str):  # quoting=3 disables quote parsing
-        total_rows += len(chunk)
-    
-    print(f"Total rows to process: {total_rows:,}")
-    
-    # Process chunks with progress bar
-    with tqdm(total=total_rows, desc='Processing rows') as pbar:
-        for chunk in pd.read_csv(file_path, sep='~', lineterminator='`', compression='gzip', 
-                               chunksize=chunk_size, on_bad_lines='skip',
-                               quoting=3, dtype=str):  # quoting=3 disables quote parsing
-            chunks.append(chunk)
-            pbar.update(len(chunk))
-            
-            # Force garbage collection after each chunk
-            gc.collect()
+    with pq.ParquetWriter(output_path, schema, compression='zstd') as writer:
+        for table in iter_custom_format(file_path, chunk_size, show_progress=False):
+            writer.write_table(conform_to_schema(clean_dates(table), schema))
+            total_rows += table.num_rows
+    return total_rows
+
+def _polars_column(field, headers):
+    """Build the Polars expression for one column of the shared output schema"""
+    if field.name not in headers:
+        # Columns this file lacks are filled with nulls
+        dtype = pl.Datetime('us') if field.name in DATE_COLUMNS else pl.String
+        return pl.lit(None, dtype=dtype).alias(field.name)
+    
+    # Empty fields become nulls, as in the other parsers
+    column = pl.when(pl.col(field.name) != '').then(pl.col(field.name))
+    if field.name in DATE_COLUMNS:
+        # Strict parsing raises on other layouts instead of silently nulling them
+        column = column.str.strptime(pl.Datetime('us'), DATE_FORMAT, strict=True)
+    return column.alias(field.name)
+
+def _has_cr_before_terminator(file_path):
+    """Check whether any field ends in a carriage return right before a row terminator"""
+    marker = b'\r' + ROW_TERMINATOR
+    tail = b''
+    for block in iter_decompressed_blocks(file_path, show_progress=False):
+        if marker in tail + block[:1] or marker in block:
+            return True
+        tail = block[-1:]
+    return False
+
+def write_file_to_parquet_polars(file_path, output_path, schema, chunk_size=100_000):
+    """Stream one file into a parquet file with a Polars lazy scan"""
+    # Polars strips a carriage return before the row terminator, the other parsers keep it
+    if _has_cr_before_terminator(file_path):
+        return write_file_to_parquet(file_path, output_path, schema, chunk_size)
+    headers = read_headers(file_path)
+    delimiter = FIELD_DELIMITER.decode()
+    try:
+        # Read each row whole (NUL never separates fields) and split it here, so rows
+        # with too many fields can be dropped like the other parsers do
+        rows = pl.scan_csv(file_path, has_header=False, separator='\x00', eol_char=ROW_TERMINATOR.decode(),
+                           quote_char=None, schema={'row': pl.String}, empty_string_is_null=False)
+        fields = pl.col('row').str.split(delimiter)
+        lf = (rows.filter(pl.col('row') != '')
+                  .slice(1)
+                  .filter(fields.list.len() <= len(headers))
+                  .select(fields.list.get(i, null_on_oob=True).alias(col) for i, col in enumerate(headers)))
+        lf = lf.select(_polars_column(field, headers) for field in schema)
+        lf.sink_parquet(output_path, compression='zstd', statistics=True, row_group_size=chunk_size)
+    except pl.exceptions.PolarsError:
+        # Dates in another layout or NUL bytes in the text: the Arrow path handles both
+        return write_file_to_parquet(file_path, output_path, schema, chunk_size)
+    return pq.read_metadata(output_path).num_rows
+
+def _remove_path(path):
+    """Remove a file or directory tree if it exists"""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def write_processed_parquet(files, output_dir, chunk_size=100_000, max_workers=None):
+    """Write each input file to a parquet part in output_dir, one worker process per file"""
+    # Parts go to a staging directory so a failed run leaves the previous output intact
+    staging_dir = f"{output_dir}.tmp"
+    _remove_path(staging_dir)
+    os.makedirs(staging_dir)
+    
+    # Every part shares one schema, so readers see the union of all files' columns
+    schema = processed_schema(files)
+    part_paths = [os.path.join(staging_dir, f"{Path(file.stem).stem}.parquet") for file in files]
+    write_part = write_file_to_parquet_polars if pl is not None else write_file_to_parquet
+    
+    # Share the cores between the workers' Polars thread pools; spawned workers inherit
+    # the environment, and Polars reads it once at import (a user setting wins)
+    n_workers = max_workers or min(len(files), os.cpu_count() or 1)
+    thread_limit_set = 'POLARS_MAX_THREADS' not in os.environ
+    if thread_limit_set:
+        os.environ['POLARS_MAX_THREADS'] = str(max(1, (os.cpu_count() or 1) // n_workers))
+    try:
+        # Spawned workers avoid forking a process that has already started Polars' thread pool
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            row_counts = executor.map(write_part, files, part_paths,
+                                      [schema] * len(files), [chunk_size] * len(files))
+            total_rows = sum(tqdm(row_counts, total=len(files), desc='Files'))
+    finally:
+        if thread_limit_set:
+            del os.environ['POLARS_MAX_THREADS']
     
-    print("\nCombining chunks...")
-    return pd.concat(chunks, ignore_index=True)
+    # Replace the output of any previous run
+    _remove_path(output_dir)
+    os.replace(staging_dir, output_dir)
+    return total_rows
 
 def process_transcripts(file_path):
     """Process transcript data from a custom-formatted CSV file"""
-    # Read the data using the custom format function
-    df = read_custom_format(file_path)
+    # Only the first chunk is needed for a sample
+    df = next(iter_custom_format(file_path)).to_pandas(types_mapper=pd.ArrowDtype)
     
     # Example processing: Print the first few rows
     print("\nSample of the processed data:")
@@ -111,54 +438,43 @@ def main():
         print("Processing cancelled.")
         return
     
-    # Process all files
-    dfs = []
+    # Stream every file into the parquet dataset so the full data never sits in memory
+    output_path = 'processed_data/processed_transcripts.parquet'
     print(f"\nProcessing {len(files)} files...")
-    for file in tqdm(files, desc='Files'):
-        print(f"\nProcessing {file.name}...")
-        df = read_custom_format(file)
-        
-        print("\nCleaning dates...")
-        # Convert date columns if they exist
-        date_columns = ['ANNOUNCEDDATEUTC', 'DATEOFCALLUTC']
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col])
-        
-        dfs.append(df)
-        
-        # Force garbage collection after each file
-        gc.collect()
-    
-    print("\nCombining all files...")
-    df = pd.concat(dfs, ignore_index=True)
+    total_rows = write_processed_parquet(files, output_path)
+    if total_rows == 0:
+        print("No rows were parsed from the input files.")
+        return
     
-    # Print summary statistics
+    # Print summary statistics from the columns they need
+    df = pd.read_parquet(output_path, columns=['COMPANYNAME', 'TRANSCRIPTCOMPONENTTYPE'],
+                         dtype_backend='pyarrow')
+    first_call, last_call = parquet_column_range(output_path, 'DATEOFCALLUTC')
     print(f"\nProcessing complete!")
-    print(f"Total rows: {len(df):,}")
+    print(f"Total rows: {total_rows:,}")
     print(f"Number of unique companies: {df['COMPANYNAME'].nunique():,}")
-    print(f"Number of columns: {len(df.columns)}")
-    print(f"Date range: {df['DATEOFCALLUTC'].min()} to {df['DATEOFCALLUTC'].max()}")
+    print(f"Number of columns: {len(ds.dataset(output_path, format='parquet').schema)}")
+    print(f"Date range: {first_call} to {last_call}")
     
     print("\nTypes of components:")
-    print(df['TRANSCRIPTCOMPONENTTYPE'].value_counts().to_string())
+    print(df['TRANSCRIPTCOMPONENTTYPE'].value_counts().head(20).to_string())
+    print(f"\nSaved PARQUET dataset: {get_file_size(output_path):.1f} MB")
     
-    # Save processed data
-    print("\nWould you like to save the processed data? (yes/no)")
+    # Export to additional formats
+    print("\nWould you like to export the processed data to other formats? (yes/no)")
     response = input().lower().strip()
     if response == 'yes':
         print("\nSelect output format(s) (comma-separated):")
-        print("Available formats: parquet, csv, hdf")
+        print("Available formats: csv, hdf")
         formats = input().lower().strip().split(',')
-        formats = [fmt.strip() for fmt in formats if fmt.strip() in ['parquet', 'csv', 'hdf']]
+        formats = [fmt.strip() for fmt in formats if fmt.strip() in ['csv', 'hdf']]
         
         if formats:
-            save_processed_data(df, formats=formats)
+            save_processed_data(pd.read_parquet(output_path), formats=formats)
         else:
-            print("No valid formats selected. Saving as parquet by default...")
-            save_processed_data(df)
+            print("No valid formats selected.")
     
     print("\nProcessing pipeline complete!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,61 @@
+import gzip
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_transcripts as pt
+
+ROWS = [
+    *[b''] * 80,              # blank rows before the header, filling the first block
+    b'A~B~C',
+    b'a1~b1~c1',
+    b'',                      # blank row
+    b'x1~x2~x3~x4',           # too many fields: skipped
+    b's1~s2',                 # short row: padded with nulls
+    b't1~t2~',                # trailing delimiter: empty last field
+    b'~e2~',                  # empty fields
+    b'n1\nn2~back\\slash~c',  # embedded newline and backslash
+    b'long' * 20 + b'~b~c',   # spans several blocks
+]
+FINAL_ROW = b'f1~f2~f3'       # no row terminator
+
+def write_fixture(path, rows):
+    path.write_bytes(gzip.compress(b'`'.join(rows + [FINAL_ROW])))
+    return path
+
+@pytest.fixture(params=['plain', 'carriage_return'])
+def fixture_path(request, tmp_path):
+    rows = list(ROWS)
+    if request.param == 'carriage_return':
+        rows.append(b'r1\r~r2~r3\r')
+    return write_fixture(tmp_path / f"{request.param}.csv.gz", rows)
+
+def records(df):
+    """Rows of a DataFrame as dicts, with empty strings and missing values as None"""
+    df = df.astype(object)
+    return df.where(df.notna() & (df != ''), None).to_dict('records')
+
+def expected_records(path):
+    return records(pd.read_csv(path, sep='~', lineterminator='`', compression='gzip',
+                               on_bad_lines='skip', quoting=3, dtype=str, keep_default_na=False))
+
+@pytest.mark.parametrize('engine', [
+    pytest.param('numba', marks=pytest.mark.skipif(pt.njit is None, reason='numba not installed')),
+    'arrow',
+])
+@pytest.mark.parametrize('block_size', [64, 1 << 22])
+def test_builtin_parsers_match_pandas(fixture_path, engine, block_size):
+    table = pa.concat_tables(pt.iter_custom_format(fixture_path, chunk_size=3, show_progress=False,
+                                                   block_size=block_size, engine=engine))
+    assert records(table.to_pandas()) == expected_records(fixture_path)
+
+@pytest.mark.skipif(pt.pl is None, reason='polars not installed')
+def test_polars_parser_matches_pandas(fixture_path, tmp_path):
+    output_path = tmp_path / 'out.parquet'
+    pt.write_file_to_parquet_polars(fixture_path, output_path, pt.processed_schema([fixture_path]))
+    assert records(pq.read_table(output_path).to_pandas()) == expected_records(fixture_path)